@@ -8,7 +8,7 @@ import sys
 import time
 
 # Update import to include the new find_any_device function
-from dfu_lib import NordicLegacyDFU, find_any_device, find_device_by_name_or_address, DfuException, DFU_SERVICE_UUID
+from dfu_lib import NordicLegacyDFU, find_any_device, find_bootloader_device, DfuException
 
 # --- Custom Logger for CLI ---
 class MsFormatter(logging.Formatter):
@@ -24,14 +24,49 @@ class MsFormatter(logging.Formatter):
 
 logger = logging.getLogger("DFU_CLI")
 
+FAST_PATH_CONNECT_TIMEOUT = 5.0 # Seconds to probe for the bootloader at the application's address
+
+PROGRESS_PRINT_INTERVAL = 0.25 # Seconds between progress redraws on a terminal
+PROGRESS_LOG_STEP = 10 # Percent between progress log lines when not on a terminal
+
+_last_progress_print = 0.0
+_last_progress_logged = -1
+
 def cli_progress_handler(pct):
-    sys.stdout.write(f"\rUploading: {pct}%")
+    global _last_progress_print, _last_progress_logged
+
+    if not sys.stdout.isatty():
+        step = pct // PROGRESS_LOG_STEP
+        if step != _last_progress_logged: # Also re-logs when a retry restarts from 0
+            _last_progress_logged = step
+            logger.info(f"Uploading: {pct}%")
+        return
+
+    now = time.monotonic()
+    if pct < 100 and now - _last_progress_print < PROGRESS_PRINT_INTERVAL:
+        return
+    _last_progress_print = now
+
+    end = "\n" if pct == 100 else ""
+    sys.stdout.write(f"\rUploading: {pct}%{end}")
     sys.stdout.flush()
-    if pct == 100:
-        sys.stdout.write("\n")
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or a positive integer, got {value}")
+    return number
 
 async def main():
-    parser = argparse.ArgumentParser(description="Nordic Semi Buttonless Legacy DFU Utility (CLI)")
+    parser = argparse.ArgumentParser(description="Nordic Semi Buttonless Legacy DFU Utility (CLI)",
+                                     epilog="Tip: install uvloop (Linux/macOS) or winloop (Windows) for the fastest DFU; "
+                                            "it is used automatically when available.")
     parser.add_argument("file", help="Path to the ZIP firmware file")
 
     # Changed: nargs='+' allows multiple arguments to be collected into a list
@@ -39,8 +74,12 @@ async def main():
 
     parser.add_argument("--scan", action="store_true", help="Force scan even if address is provided")
     parser.add_argument("--adapter", default=None, help="Bluetooth Adapter interface (Linux: hci0)")
-    parser.add_argument("--prn", type=int, default=8, help="PRN interval (default 8)")
+    parser.add_argument("--prn", type=int, default=0, help="PRN interval, 0 disables receipt notifications (default 0). "
+                                                             "Faster, but slow or unreliable links may need e.g. 8")
+    parser.add_argument("--prn-auto", action="store_true", help="Retry with PRN 8 if an attempt with PRN 0 fails")
     parser.add_argument("--delay", type=float, default=0.4, help="Start/Size Delay (default 0.4s)")
+    parser.add_argument("--chunk-size", type=non_negative_int, default=0, help="Firmware packet size in bytes, 0 = auto from negotiated MTU (default 0)")
+    parser.add_argument("--pipeline", type=positive_int, default=1, help="Write-without-response packets in flight (default 1). Try 4-8 on good links")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose debug logs")
 
     # New Arguments
@@ -63,10 +102,13 @@ async def main():
 
     logger.addHandler(handler)
     logging.getLogger("DFU_LIB").addHandler(handler) # Attach handler to lib logger
+    logger.debug(f"Event loop: {type(asyncio.get_running_loop()).__module__}")
 
+    dfu = None
     try:
         # Pass None for log_callback so the library uses the standard logger configured above
-        dfu = NordicLegacyDFU(args.file, args.prn, args.delay, adapter=args.adapter, progress_callback=cli_progress_handler)
+        dfu = NordicLegacyDFU(args.file, args.prn, args.delay, adapter=args.adapter, progress_callback=cli_progress_handler,
+                              prn_auto=args.prn_auto, chunk_size=args.chunk_size, pipeline_depth=args.pipeline)
         dfu.parse_zip()
 
         logger.info(f"Scanning for target(s): {args.device}...")
@@ -93,27 +135,13 @@ async def main():
         logger.info("Waiting for reboot (5s)...")
         await asyncio.sleep(5.0)
 
-        bootloader_device = None
-        try:
-            logger.info("Scanning for Bootloader (UUID)...")
-            bootloader_device = await find_device_by_name_or_address("DFU", force_scan=True, adapter=args.adapter, service_uuid=DFU_SERVICE_UUID)
-        except DfuException:
-            pass
-
-        if not bootloader_device:
-            original_mac = app_device.address
-            if ":" in original_mac and len(original_mac) == 17:
-                try:
-                    prefix = original_mac[:-2]
-                    last_byte = int(original_mac[-2:], 16)
-                    last_byte = (last_byte + 1) & 0xFF
-                    bootloader_mac_hint = f"{prefix}{last_byte:02X}"
-                    logger.info(f"Scanning for Bootloader (Hint: {bootloader_mac_hint})...")
-                    bootloader_device = await find_device_by_name_or_address(bootloader_mac_hint, force_scan=True, adapter=args.adapter)
-                except: pass
-
-        if not bootloader_device:
-            raise DfuException("Could not locate DFU Bootloader device.")
+        # Fast path: many bootloaders keep the application's address, probe it before scanning
+        logger.info(f"Probing for Bootloader at {app_device.address}...")
+        if await dfu.probe_bootloader(app_device, timeout=FAST_PATH_CONNECT_TIMEOUT):
+            bootloader_device = app_device
+        else:
+            logger.info(f"Scanning for Bootloader (DFU service or address near {app_device.address})...")
+            bootloader_device = await find_bootloader_device(app_device.address, adapter=args.adapter)
 
         # Pass the custom retry count here
         await dfu.perform_update(bootloader_device, max_retries=args.retry)
@@ -124,6 +152,24 @@ async def main():
     except Exception as e:
         logger.error(f"Failed: {e}")
         sys.exit(1)
+    finally:
+        if dfu:
+            dfu.close()
+
+def run_with_fast_event_loop(coro):
+    """Runs coro on uvloop (Linux/macOS) or winloop (Windows) if installed, otherwise on the default asyncio loop."""
+    try:
+        if sys.platform == "win32":
+            import winloop as fast_loop
+        else:
+            import uvloop as fast_loop
+    except ImportError:
+        return asyncio.run(coro)
+
+    if hasattr(asyncio, "Runner"): # Python 3.11+
+        with asyncio.Runner(loop_factory=fast_loop.new_event_loop) as runner:
+            return runner.run(coro)
+    return fast_loop.run(coro)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    run_with_fast_event_loop(main())
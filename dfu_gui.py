@@ -254,6 +254,7 @@ class DfuApp:
                 await asyncio.sleep(0.1)
 
     async def _async_perform_dfu(self, zip_path, device, prn_val, force_scan):
+        dfu = None
         try:
             # 1. Stop any active scan before starting DFU
             await self._stop_scan_if_running()
@@ -317,6 +318,8 @@ class DfuApp:
             self.log(f"ERROR: {e}")
             messagebox.showerror("Error", str(e))
         finally:
+            if dfu:
+                dfu.close()
             self.root.after(0, lambda: self.start_btn.config(state="normal"))
             self.root.after(0, lambda: self.scan_btn.config(state="normal"))
 
@@ -4,17 +4,27 @@ import logging
 import struct
 import zipfile
 import json
+import mmap
 import os
+import shutil
+import socket
+import sys
+import tempfile
 import warnings
-from typing import Optional, Callable, List
+from typing import Optional, Callable, Dict, List, Union
 
 from bleak import BleakScanner, BleakClient, BleakError
+from bleak.backends.characteristic import BleakGATTCharacteristic
 from bleak.backends.device import BLEDevice
 
 # --- UUID Constants ---
 DFU_SERVICE_UUID = "00001530-1212-efde-1523-785feabcd123"
 DFU_CONTROL_POINT_UUID = "00001531-1212-efde-1523-785feabcd123"
 DFU_PACKET_UUID = "00001532-1212-efde-1523-785feabcd123"
+DFU_VERSION_UUID = "00001534-1212-efde-1523-785feabcd123"
+
+# --- DFU Version ---
+DFU_VERSION_APPLICATION = 0x0001 # Version 0.1 is reported by buttonless applications, not the bootloader
 
 # --- Op Codes ---
 OP_CODE_START_DFU = 0x01
@@ -29,6 +39,37 @@ OP_CODE_PACKET_RECEIPT_NOTIF = 0x11
 OP_CODE_ENTER_BOOTLOADER = 0x01
 UPLOAD_MODE_APPLICATION = 0x04
 
+# --- Fixed Control Point Payloads ---
+PAYLOAD_JUMP = bytes([OP_CODE_ENTER_BOOTLOADER, UPLOAD_MODE_APPLICATION])
+PAYLOAD_START_APP = bytes([OP_CODE_START_DFU, UPLOAD_MODE_APPLICATION])
+PAYLOAD_INIT_START = bytes([OP_CODE_INIT_DFU_PARAMS, 0x00])
+PAYLOAD_INIT_END = bytes([OP_CODE_INIT_DFU_PARAMS, 0x01])
+PAYLOAD_RECV_FW = bytes([OP_CODE_RECEIVE_FIRMWARE_IMAGE])
+PAYLOAD_VALIDATE = bytes([OP_CODE_VALIDATE])
+PAYLOAD_ACTIVATE = bytes([OP_CODE_ACTIVATE_AND_RESET])
+PAYLOAD_RESET = bytes([OP_CODE_RESET])
+
+# --- Bootloader Discovery ---
+# Offsets bootloaders apply to the last address byte, most likely first (+1 is Nordic's legacy default)
+BOOTLOADER_ADDRESS_DELTAS = (1, 0, -1, 2)
+
+# --- Precompiled Packet Layouts ---
+_SIZE_STRUCT = struct.Struct('<III')   # SoftDevice, Bootloader, Application size
+_PRN_REQ_STRUCT = struct.Struct('<BH') # Op code, PRN interval
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+
+# --- Connection Parameters ---
+# 7.5 ms interval (1.25 ms units), no slave latency, 500 ms supervision timeout (10 ms units)
+CONN_INTERVAL_MIN = 6
+CONN_INTERVAL_MAX = 6
+CONN_LATENCY = 0
+CONN_SUPERVISION_TIMEOUT = 50
+
+# --- PRN ---
+PRN_AUTO_FALLBACK = 8  # PRN used by prn_auto after an unsynchronized (PRN 0) attempt fails
+PRN_DISABLED_YIELD_INTERVAL = 32  # With PRN 0, yield to the event loop every N packets
+
 logger = logging.getLogger("DFU_LIB")
 
 class DfuException(Exception):
@@ -37,23 +78,37 @@ class DfuException(Exception):
 class NordicLegacyDFU:
     def __init__(self, zip_path: str, prn: int, packet_delay: float, adapter: str = None,
                  progress_callback: Callable[[int], None] = None,
-                 log_callback: Callable[[str], None] = None):
+                 log_callback: Callable[[str], None] = None,
+                 pipeline_depth: int = 1, prn_auto: bool = False, chunk_size: int = 0):
         self.zip_path = zip_path
         self.prn = prn
         self.packet_delay = packet_delay
         self.adapter = adapter
+        if pipeline_depth < 1:
+            raise ValueError(f"pipeline_depth must be at least 1, got {pipeline_depth}")
+        if chunk_size < 0:
+            raise ValueError(f"chunk_size must be 0 (auto) or positive, got {chunk_size}")
+        self.pipeline_depth = pipeline_depth
+        self.prn_auto = prn_auto
+        self.chunk_size = chunk_size # 0 = derive from the negotiated MTU
         self.progress_callback = progress_callback
         self.log_callback = log_callback
 
         self.manifest = None
         self.bin_data = None
+        self._bin_file = None
         self.dat_data = None
         self.client: Optional[BleakClient] = None
+        # Resolved once per connection so writes skip the UUID lookup
+        self._cp_char: Union[str, BleakGATTCharacteristic] = DFU_CONTROL_POINT_UUID
+        self._packet_char: Union[str, BleakGATTCharacteristic] = DFU_PACKET_UUID
 
-        self.response_queue = asyncio.Queue()
+        self._pending: Dict[int, asyncio.Future] = {}
         self.pkg_receipt_event = asyncio.Event()
         self.bytes_sent = 0
         self.reset_in_progress = False
+        self.upload_started = False
+        self._write_sock: Optional[socket.socket] = None
 
     def _log(self, msg: str, level=logging.INFO):
         """Internal helper to route logs to both logger and callback."""
@@ -86,6 +141,98 @@ class NordicLegacyDFU:
                 mtu = 23
         return mtu
 
+    def _request_short_conn_interval(self) -> List[tuple]:
+        """
+        Linux/BlueZ: set the kernel defaults used for new LE connections to a 7.5 ms interval.
+        Must run before connecting; requires debugfs and root, otherwise it is skipped.
+        Returns the (path, original value) pairs that were changed, for _restore_conn_interval.
+        """
+        if not sys.platform.startswith("linux"):
+            return []
+
+        hci_dir = os.path.join("/sys/kernel/debug/bluetooth", self.adapter or "hci0")
+        # Order matters: the kernel rejects min > max, so lower min before max
+        params = (
+            ("conn_min_interval", CONN_INTERVAL_MIN),
+            ("conn_max_interval", CONN_INTERVAL_MAX),
+            ("conn_latency", CONN_LATENCY),
+            ("supervision_timeout", CONN_SUPERVISION_TIMEOUT),
+        )
+        saved = []
+        try:
+            for name, value in params:
+                path = os.path.join(hci_dir, name)
+                with open(path) as f:
+                    original = f.read().strip()
+                with open(path, "w") as f:
+                    f.write(str(value))
+                saved.append((path, original))
+            logger.debug("Requested %s ms connection interval via %s", CONN_INTERVAL_MIN * 1.25, hci_dir)
+        except OSError as e:
+            logger.debug("Could not set connection parameters: %s", e)
+        return saved
+
+    def _restore_conn_interval(self, saved: List[tuple]):
+        """Puts back the kernel connection defaults changed by _request_short_conn_interval."""
+        # Reverse order raises max before min, keeping min <= max at every step
+        for path, original in reversed(saved):
+            try:
+                with open(path, "w") as f:
+                    f.write(original)
+            except OSError as e:
+                logger.debug("Could not restore %s: %s", path, e)
+
+    async def _set_high_priority(self, client: BleakClient):
+        """
+        Windows: ask the OS for throughput optimized connection parameters (Windows 11+).
+        Other platforms either don't expose this knob or handle it before connecting.
+        """
+        if sys.platform != "win32":
+            return
+
+        try:
+            try:
+                from winrt.windows.devices.bluetooth import BluetoothLEPreferredConnectionParameters
+            except ImportError:
+                from bleak_winrt.windows.devices.bluetooth import BluetoothLEPreferredConnectionParameters
+
+            requester = client._backend._requester
+            requester.request_preferred_connection_parameters(
+                BluetoothLEPreferredConnectionParameters.throughput_optimized
+            )
+            logger.debug("Requested throughput optimized connection parameters")
+        except Exception as e:
+            logger.debug("Could not request connection priority: %s", e)
+
+    def _map_bin_file(self, z: zipfile.ZipFile, name: str):
+        """Extracts the firmware image to a temp file and memory-maps it instead of reading it into RAM."""
+        self.close()
+        tmp = tempfile.TemporaryFile()
+        try:
+            with z.open(name) as src:
+                shutil.copyfileobj(src, tmp)
+            tmp.flush()
+            if tmp.tell() == 0:
+                raise DfuException(f"Firmware image {name} is empty.")
+            self.bin_data = mmap.mmap(tmp.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            tmp.close()
+            raise
+        self._bin_file = tmp
+
+    def close(self):
+        """Releases the memory-mapped firmware image and its temp file."""
+        if isinstance(self.bin_data, mmap.mmap):
+            try:
+                self.bin_data.close()
+            except BufferError:
+                pass # Still referenced by packet views, freed once they are collected
+        self.bin_data = None
+
+        if self._bin_file:
+            self._bin_file.close()
+            self._bin_file = None
+
     def parse_zip(self):
         if not os.path.exists(self.zip_path):
             raise FileNotFoundError(f"File not found: {self.zip_path}")
@@ -97,7 +244,7 @@ class NordicLegacyDFU:
 
                 if 'manifest' in self.manifest and 'application' in self.manifest['manifest']:
                     app_info = self.manifest['manifest']['application']
-                    self.bin_data = z.read(app_info['bin_file'])
+                    self._map_bin_file(z, app_info['bin_file'])
                     self.dat_data = z.read(app_info['dat_file'])
                 else:
                     raise DfuException("Zip must contain an Application firmware manifest.")
@@ -108,32 +255,40 @@ class NordicLegacyDFU:
                 dat_file = next((f for f in files if f.endswith('.dat') and 'application' in f.lower()), None)
 
                 if bin_file and dat_file:
-                    self.bin_data = z.read(bin_file)
+                    self._map_bin_file(z, bin_file)
                     self.dat_data = z.read(dat_file)
                 else:
                     raise DfuException("Could not auto-detect firmware files in ZIP.")
 
     async def _notification_handler(self, sender, data):
-        data = bytearray(data)
+        # bleak already delivers a bytearray, index it directly
         opcode = data[0]
 
         if opcode == OP_CODE_RESPONSE_CODE:
             request_op = data[1]
             status = data[2]
-            logger.debug(f"<< RX Resp: Op={request_op:#02x} Status={status}")
-            await self.response_queue.put((request_op, status))
+            logger.debug("<< RX Resp: Op=%#02x Status=%d", request_op, status)
+            fut = self._response_future(request_op)
+            if not fut.done():
+                fut.set_result(status)
 
         elif opcode == OP_CODE_PACKET_RECEIPT_NOTIF:
             if len(data) >= 5:
-                bytes_received = struct.unpack('<I', data[1:5])[0]
-                logger.debug(f"<< RX PRN: {bytes_received}")
+                bytes_received = _U32.unpack_from(data, 1)[0]
+                logger.debug("<< RX PRN: %d", bytes_received)
             self.pkg_receipt_event.set()
 
+    def _response_future(self, op_code: int) -> asyncio.Future:
+        """Returns the pending response slot for op_code, creating it if the response hasn't arrived yet."""
+        fut = self._pending.get(op_code)
+        if fut is None:
+            fut = asyncio.get_running_loop().create_future()
+            self._pending[op_code] = fut
+        return fut
+
     async def _wait_for_response(self, expected_op_code, timeout=30.0):
         try:
-            request_op, status = await asyncio.wait_for(self.response_queue.get(), timeout)
-            if request_op != expected_op_code:
-                return -1
+            status = await asyncio.wait_for(self._response_future(expected_op_code), timeout)
 
             if status != 1: # 1 = SUCCESS
                 self._log(f"<< RX Error: Command {expected_op_code:#02x} failed with status {status}", logging.ERROR)
@@ -142,27 +297,61 @@ class NordicLegacyDFU:
         except asyncio.TimeoutError:
             self._log(f"Timeout ({timeout}s) waiting for response", logging.ERROR)
             return -1
+        finally:
+            self._pending.pop(expected_op_code, None)
 
     async def jump_to_bootloader(self, device: BLEDevice):
         self._log(f"Connecting to {device.name} ({device.address}) for Jump...")
         try:
             async with BleakClient(device, adapter=self.adapter) as client:
                 self.client = client
-                await client.start_notify(DFU_CONTROL_POINT_UUID, self._notification_handler)
-                mtu = await self._setup_mtu()
+                # Independent ATT/D-Bus operations, overlap them
+                _, mtu = await asyncio.gather(
+                    client.start_notify(DFU_CONTROL_POINT_UUID, self._notification_handler),
+                    self._setup_mtu(),
+                )
                 self._log(f"Connected. MTU: {mtu}")
 
-                payload = bytearray([OP_CODE_ENTER_BOOTLOADER, UPLOAD_MODE_APPLICATION])
-
-                logger.debug(f">> TX Jump: {payload.hex()}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(">> TX Jump: %s", PAYLOAD_JUMP.hex())
                 try:
-                    await client.write_gatt_char(DFU_CONTROL_POINT_UUID, payload, response=True)
+                    await client.write_gatt_char(DFU_CONTROL_POINT_UUID, PAYLOAD_JUMP, response=True)
                 except Exception:
                     pass
                 self._log("Jump command sent.")
         except Exception as e:
             self._log(f"Jump connection sequence ended: {e}")
 
+    async def probe_bootloader(self, device: BLEDevice, timeout: float = 5.0) -> bool:
+        """Connects briefly and reports whether the device is running the DFU bootloader (not the application)."""
+        try:
+            async with BleakClient(device, timeout=timeout, adapter=self.adapter) as client:
+                return await self._is_bootloader(client)
+        except Exception as e:
+            logger.debug("Probe of %s failed: %s", device.address, e)
+            return False
+
+    async def _is_bootloader(self, client: BleakClient) -> bool:
+        """
+        Tells the bootloader from a buttonless application, which exposes the same control point.
+        Same rules as Nordic's legacy DFU library: DFU Version 0.1 means application mode; without
+        a version characteristic, more than 3 services (GAP, GATT, DFU) means application mode.
+        """
+        services = client.services
+        if services.get_characteristic(DFU_CONTROL_POINT_UUID) is None:
+            return False
+
+        version_char = services.get_characteristic(DFU_VERSION_UUID)
+        if version_char is not None:
+            data = await client.read_gatt_char(version_char)
+            if len(data) < _U16.size:
+                return False
+            version = _U16.unpack_from(data)[0]
+            logger.debug("DFU Version: %#06x", version)
+            return version != DFU_VERSION_APPLICATION
+
+        return len(services.services) <= 3
+
     async def perform_update(self, device: BLEDevice, max_retries: int = 3):
         self._log(f"Target Bootloader: {device.address}")
         self.reset_in_progress = False
@@ -170,20 +359,35 @@ class NordicLegacyDFU:
         for attempt in range(max_retries):
             self._log(f"DFU connection attempt {attempt+1}/{max_retries}...")
 
+            saved_conn_params = self._request_short_conn_interval()
+            self.upload_started = False
+
             try:
                 async with BleakClient(device, timeout=20.0, adapter=self.adapter) as client:
                     self.client = client
-
-                    await client.start_notify(DFU_CONTROL_POINT_UUID, self._notification_handler)
-
-                    mtu = await self._setup_mtu()
+                    await self._set_high_priority(client)
+
+                    # Independent ATT/D-Bus operations, overlap them
+                    _, mtu = await asyncio.gather(
+                        client.start_notify(DFU_CONTROL_POINT_UUID, self._notification_handler),
+                        self._setup_mtu(),
+                    )
+                    self._cp_char = client.services.get_characteristic(DFU_CONTROL_POINT_UUID) or DFU_CONTROL_POINT_UUID
+                    self._packet_char = client.services.get_characteristic(DFU_PACKET_UUID) or DFU_PACKET_UUID
+
+                    max_chunk_size = max(mtu - 3, 20)  # ATT overhead
+                    if self.chunk_size > 0:
+                        chunk_size = min(self.chunk_size, max_chunk_size)
+                        if chunk_size < self.chunk_size:
+                            self._log(f"Chunk size {self.chunk_size} exceeds MTU payload, using {chunk_size}", logging.WARNING)
+                    else:
+                        chunk_size = min(max_chunk_size, 244)  # cap at 244
                     self._log(f"Connected to Bootloader. MTU: {mtu}")
 
-                    while not self.response_queue.empty(): self.response_queue.get_nowait()
+                    self._pending.clear()
 
                     # Start DFU
-                    start_payload = bytearray([OP_CODE_START_DFU, UPLOAD_MODE_APPLICATION])
-                    await client.write_gatt_char(DFU_CONTROL_POINT_UUID, start_payload, response=True)
+                    await client.write_gatt_char(self._cp_char, PAYLOAD_START_APP, response=True)
 
                     if self.packet_delay > 0:
                         await asyncio.sleep(self.packet_delay)
@@ -191,21 +395,21 @@ class NordicLegacyDFU:
                     sd_size = 0
                     bl_size = 0
                     app_size = len(self.bin_data)
-                    size_payload = struct.pack('<III', sd_size, bl_size, app_size)
+                    size_payload = _SIZE_STRUCT.pack(sd_size, bl_size, app_size)
 
                     self._log(f"Sending Size: {app_size} bytes")
-                    await client.write_gatt_char(DFU_PACKET_UUID, size_payload, response=False)
+                    await client.write_gatt_char(self._packet_char, size_payload, response=False)
 
                     status = await self._wait_for_response(OP_CODE_START_DFU, timeout=60.0)
                     if status != 1:
-                        await client.write_gatt_char(DFU_CONTROL_POINT_UUID, bytearray([OP_CODE_RESET]), response=True)
+                        await client.write_gatt_char(self._cp_char, PAYLOAD_RESET, response=True)
                         raise DfuException("Start DFU sequence failed")
 
                     # Init Packet
                     self._log("Sending Init Packet...")
-                    await client.write_gatt_char(DFU_CONTROL_POINT_UUID, bytearray([OP_CODE_INIT_DFU_PARAMS, 0x00]), response=True)
-                    await client.write_gatt_char(DFU_PACKET_UUID, self.dat_data, response=False)
-                    await client.write_gatt_char(DFU_CONTROL_POINT_UUID, bytearray([OP_CODE_INIT_DFU_PARAMS, 0x01]), response=True)
+                    await client.write_gatt_char(self._cp_char, PAYLOAD_INIT_START, response=True)
+                    await client.write_gatt_char(self._packet_char, self.dat_data, response=False)
+                    await client.write_gatt_char(self._cp_char, PAYLOAD_INIT_END, response=True)
 
                     status = await self._wait_for_response(OP_CODE_INIT_DFU_PARAMS)
                     if status != 1: raise DfuException(f"Init Packet failed. Status: {status}")
@@ -213,29 +417,30 @@ class NordicLegacyDFU:
                     # PRN
                     if self.prn > 0:
                         self._log(f"Configuring PRN: {self.prn}")
-                        prn_payload = bytearray([OP_CODE_PACKET_RECEIPT_NOTIF_REQ]) + struct.pack('<H', self.prn)
-                        await client.write_gatt_char(DFU_CONTROL_POINT_UUID, prn_payload, response=True)
+                        prn_payload = _PRN_REQ_STRUCT.pack(OP_CODE_PACKET_RECEIPT_NOTIF_REQ, self.prn)
+                        await client.write_gatt_char(self._cp_char, prn_payload, response=True)
 
                     # Stream
                     self._log("Requesting Upload...")
-                    await client.write_gatt_char(DFU_CONTROL_POINT_UUID, bytearray([OP_CODE_RECEIVE_FIRMWARE_IMAGE]), response=True)
-                    await self._stream_firmware()
+                    await client.write_gatt_char(self._cp_char, PAYLOAD_RECV_FW, response=True)
+                    await self._stream_firmware(chunk_size)
 
                     # Validate
                     self._log("Verifying Upload...")
                     flash_write_timeout = max(60.0, len(self.bin_data) / 50000) # Longer timeout for flash write completion - ~1s per 50KB
                     status = await self._wait_for_response(OP_CODE_RECEIVE_FIRMWARE_IMAGE, timeout=flash_write_timeout)
+                    self._close_write_socket()
                     if status != 1: raise DfuException(f"Upload failed. Status: {status}")
 
                     self._log("Validating...")
-                    await client.write_gatt_char(DFU_CONTROL_POINT_UUID, bytearray([OP_CODE_VALIDATE]), response=True)
+                    await client.write_gatt_char(self._cp_char, PAYLOAD_VALIDATE, response=True)
                     status = await self._wait_for_response(OP_CODE_VALIDATE)
                     if status != 1: raise DfuException(f"Validation failed. Status: {status}")
 
                     # Reset
                     self._log("Activating & Resetting...")
                     self.reset_in_progress = True
-                    await client.write_gatt_char(DFU_CONTROL_POINT_UUID, bytearray([OP_CODE_ACTIVATE_AND_RESET]), response=True)
+                    await client.write_gatt_char(self._cp_char, PAYLOAD_ACTIVATE, response=True)
                     self._log("DFU Complete.")
                     return # SUCCESS
 
@@ -244,20 +449,99 @@ class NordicLegacyDFU:
                     self._log(f"Device disconnected during reset. Update Successful.")
                     return
                 self._log(f"Attempt {attempt+1} failed: {e}", logging.ERROR)
+                # Only upload failures hint at a PRN problem, not connect/setup failures
+                if self.prn_auto and self.prn == 0 and self.upload_started:
+                    self.prn = PRN_AUTO_FALLBACK
+                    self._log(f"Falling back to PRN {self.prn}", logging.WARNING)
                 if attempt < max_retries - 1:
                     await asyncio.sleep(3.0)
                 else:
                     raise e
+            finally:
+                self._close_write_socket()
+                self._restore_conn_interval(saved_conn_params)
+
+    async def _acquire_write_socket(self, chunk_size: int) -> Optional[socket.socket]:
+        """
+        BlueZ: acquire a SOCK_SEQPACKET socket for the packet characteristic (AcquireWrite),
+        so packet writes bypass D-Bus. Returns None on other backends or if BlueZ refuses.
+        """
+        backend = getattr(self.client, "_backend", None)
+        if backend.__class__.__name__ != "BleakClientBlueZDBus":
+            return None
 
-    async def _stream_firmware(self):
-        # Suppress warning when reading MTU for chunk calculation
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore", UserWarning)
-            mtu = self.client.mtu_size if self.client else 23
-        chunk_size = min(mtu - 3, 244)  # ATT overhead, cap at 244
-        if chunk_size < 20: chunk_size = 20
+        try:
+            from dbus_fast import Message, MessageType
+
+            reply = await backend._bus.call(
+                Message(
+                    destination="org.bluez",
+                    path=self._packet_char.path,
+                    interface="org.bluez.GattCharacteristic1",
+                    member="AcquireWrite",
+                    signature="a{sv}",
+                    body=[{}],
+                )
+            )
+            if reply.message_type != MessageType.METHOD_RETURN:
+                raise DfuException(reply.body[0] if reply.body else reply.error_name)
+
+            sock = socket.socket(fileno=reply.unix_fds[0])
+            mtu = reply.body[1]
+        except Exception as e:
+            logger.debug("AcquireWrite unavailable, using GATT writes: %s", e)
+            return None
+
+        if chunk_size > mtu - 3:
+            logger.debug("AcquireWrite MTU %d too small for chunk_size %d, using GATT writes", mtu, chunk_size)
+            sock.close()
+            return None
+
+        sock.setblocking(False)
+        self._log("Using BlueZ write socket for firmware packets")
+        return sock
+
+    async def _send_packet(self, chunk: memoryview, window: asyncio.Semaphore):
+        try:
+            await self.client.write_gatt_char(self._packet_char, chunk, response=False)
+        finally:
+            window.release()
+
+    @staticmethod
+    async def _drain_writes(in_flight: List[asyncio.Task]):
+        """Waits for all in-flight packet writes, raising the first failure."""
+        if in_flight:
+            await asyncio.gather(*in_flight)
+            in_flight.clear()
+
+    @staticmethod
+    def _reap_writes(in_flight: List[asyncio.Task]):
+        """Drops finished packet writes from in_flight without waiting on the rest, raising the first failure."""
+        pending = []
+        for task in in_flight:
+            if not task.done():
+                pending.append(task)
+            elif task.exception():
+                raise task.exception()
+        in_flight[:] = pending
+
+    @staticmethod
+    def _progress_marks(total_bytes: int, chunk_size: int) -> Dict[int, int]:
+        """Maps packet count -> percentage done, only for the (at most 100) packets where the percentage changes."""
+        marks = {}
+        for pct in range(1, 101):
+            needed_bytes = -(-pct * total_bytes // 100)
+            marks[-(-needed_bytes // chunk_size)] = pct # Later (higher) pct wins for a shared packet
+        return marks
+
+    def _close_write_socket(self):
+        if self._write_sock is not None:
+            self._write_sock.close()
+            self._write_sock = None
+
+    async def _stream_firmware(self, chunk_size: int):
+        self.upload_started = True
         self._log(f"Using chunk_size = {chunk_size}")
-        self._last_progress_block = -1
         total_bytes = len(self.bin_data)
         packets_since_prn = 0
         self.bytes_sent = 0
@@ -266,30 +550,65 @@ class NordicLegacyDFU:
 
         self._log(f"Uploading {total_bytes} bytes...")
 
-        for i in range(0, total_bytes, chunk_size):
-            chunk = self.bin_data[i : i + chunk_size]
-            await self.client.write_gatt_char(DFU_PACKET_UUID, chunk, response=False)
-            self.bytes_sent += len(chunk)
-            packets_since_prn += 1
-
-            pct = int((self.bytes_sent * 100) / total_bytes)
-
-            last_pct = getattr(self, "_last_progress_pct", -1)
-            if pct > last_pct:
-                if self.progress_callback:
-                    self.progress_callback(pct)
-                self._last_progress_pct = pct
-
-            if self.prn > 0 and packets_since_prn >= self.prn:
-                self.pkg_receipt_event.clear()
-                try:
-                    await asyncio.wait_for(self.pkg_receipt_event.wait(), timeout=prn_timeout)
-                except asyncio.TimeoutError:
-                    self._log("PRN Timeout, continuing anyway...", logging.WARNING)
-                packets_since_prn = 0
-
+        # One zero-copy view of the image, sliced per packet instead of copying bytes
+        bin_view = memoryview(self.bin_data)
+        progress_marks = self._progress_marks(total_bytes, chunk_size)
+        last_pct = -1
+
+        write_sock = await self._acquire_write_socket(chunk_size)
+        # Closed by perform_update only after the upload response: sock_sendall returns once data
+        # is buffered, and closing early makes bluetoothd drop packets it hasn't read yet
+        self._write_sock = write_sock
+        loop = asyncio.get_running_loop()
+        # Sliding window of up to pipeline_depth writes in flight. Depth 1 keeps
+        # strictly sequential writes.
+        window = asyncio.Semaphore(self.pipeline_depth)
+        in_flight: List[asyncio.Task] = []
+        try:
+            for idx, offset in enumerate(range(0, total_bytes, chunk_size), 1):
+                chunk = bin_view[offset : offset + chunk_size]
+                if self.prn > 0 and packets_since_prn == 0:
+                    self.pkg_receipt_event.clear()
+
+                if write_sock is not None:
+                    # Socket writes must stay sequential to keep packet order
+                    await loop.sock_sendall(write_sock, chunk)
+                elif self.pipeline_depth > 1:
+                    await window.acquire()
+                    in_flight.append(loop.create_task(self._send_packet(chunk, window)))
+                else:
+                    await self.client.write_gatt_char(self._packet_char, chunk, response=False)
+                packets_since_prn += 1
+
+                pct = progress_marks.get(idx)
+                if pct is not None:
+                    self.bytes_sent = min(idx * chunk_size, total_bytes)
+                    if self.progress_callback:
+                        self.progress_callback(pct)
+                    last_pct = pct
+
+                if self.prn > 0 and packets_since_prn >= self.prn:
+                    await self._drain_writes(in_flight)
+                    try:
+                        await asyncio.wait_for(self.pkg_receipt_event.wait(), timeout=prn_timeout)
+                    except asyncio.TimeoutError:
+                        self._log("PRN Timeout, continuing anyway...", logging.WARNING)
+                    packets_since_prn = 0
+                elif self.prn == 0 and packets_since_prn >= PRN_DISABLED_YIELD_INTERVAL:
+                    # Nothing to wait on without PRN: reap finished writes (the window stays full)
+                    # and let notification handlers run
+                    self._reap_writes(in_flight)
+                    await asyncio.sleep(0)
+                    packets_since_prn = 0
+
+            await self._drain_writes(in_flight)
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+        self.bytes_sent = total_bytes
         if self.progress_callback:
-            if getattr(self, "_last_progress_pct", -1) < 100:
+            if last_pct < 100:
                 self.progress_callback(100)
 
 async def scan_for_devices(adapter: str = None) -> List[BLEDevice]:
@@ -312,18 +631,19 @@ async def find_device_by_name_or_address(name_or_address: str, force_scan: bool,
     scanned_devices = await scanner.discover(timeout=5.0, return_adv=True)
 
     target = None
+    target_addr_upper = name_or_address.upper()
+    svc_lower = service_uuid.lower() if service_uuid else None
 
-    for key, (d, adv) in scanned_devices.items():
-        if d.address.upper() == name_or_address.upper():
+    for d, adv in scanned_devices.values():
+        if d.address.upper() == target_addr_upper:
             target = d; break
 
         adv_name = adv.local_name or d.name or ""
         if adv_name == name_or_address:
             target = d; break
 
-        if not target and service_uuid:
-            if service_uuid.lower() in [u.lower() for u in adv.service_uuids]:
-                target = d; break
+        if svc_lower and any(u.lower() == svc_lower for u in adv.service_uuids):
+            target = d; break
 
     if not target:
         raise DfuException("Device not found.")
@@ -342,7 +662,7 @@ async def find_any_device(identifiers: List[str], adapter: str = None, service_u
     for identifier in identifiers:
         identifier_upper = identifier.upper()
 
-        for key, (d, adv) in scanned_devices.items():
+        for d, adv in scanned_devices.values():
             # 1. Check Address Match
             if d.address.upper() == identifier_upper:
                 return d
@@ -352,12 +672,55 @@ async def find_any_device(identifiers: List[str], adapter: str = None, service_u
             if adv_name == identifier:
                 return d
 
-            # 3. Check Service UUID (only if identifier matches special UUID string if applicable)
-            # (Logic handled separately usually, but here checking generally)
-            if service_uuid and service_uuid.lower() in [u.lower() for u in adv.service_uuids]:
-                # This is a bit ambiguous if multiple devices have the UUID,
-                # but this function targets specific identifiers.
-                # If identifier was "DFU_SERVICE", it would catch here.
-                pass
-
     raise DfuException(f"No devices found matching: {identifiers}")
+
+def _shift_address(address: str, delta: int) -> Optional[str]:
+    """Returns a MAC address with its last byte shifted by delta, or None for non-MAC addresses (macOS UUIDs)."""
+    address = address.upper()
+    if not (":" in address and len(address) == 17):
+        return address if delta == 0 else None
+    return f"{address[:-2]}{(int(address[-2:], 16) + delta) & 0xFF:02X}"
+
+def bootloader_address_candidates(app_address: str) -> List[str]:
+    """
+    Returns the addresses a bootloader may advertise with after a buttonless jump, most likely first:
+    the application address with its last byte shifted by BOOTLOADER_ADDRESS_DELTAS.
+    """
+    shifted = (_shift_address(app_address, delta) for delta in BOOTLOADER_ADDRESS_DELTAS)
+    return [address for address in shifted if address]
+
+async def find_bootloader_device(app_address: str, adapter: str = None, timeout: float = 3.0) -> BLEDevice:
+    """
+    Scans once and returns the bootloader of a device that just jumped from its application.
+    Ranking: a DFU service advertiser at a candidate address (in BOOTLOADER_ADDRESS_DELTAS order),
+    then any other DFU service advertiser, then a device at application address + 1 (the legacy hint).
+    Devices at other candidate addresses without the DFU service (the app itself, fleet neighbours) never match.
+    """
+    candidates = bootloader_address_candidates(app_address)
+    candidate_rank = {address: rank for rank, address in enumerate(candidates)}
+    address_hint = _shift_address(app_address, 1)
+    svc_lower = DFU_SERVICE_UUID.lower()
+
+    scanner = BleakScanner(adapter=adapter)
+    scanned_devices = await scanner.discover(timeout=timeout, return_adv=True)
+
+    best = None
+    best_key = None
+    for d, adv in scanned_devices.values():
+        address = d.address.upper()
+
+        if any(u.lower() == svc_lower for u in adv.service_uuids):
+            rank = candidate_rank.get(address)
+            key = (0, rank) if rank is not None else (1, 0)
+        elif address == address_hint:
+            key = (2, 0)
+        else:
+            continue
+
+        if best_key is None or key < best_key:
+            best, best_key = d, key
+
+    if best:
+        return best
+
+    raise DfuException(f"No bootloader found at {candidates} or advertising the DFU service.")